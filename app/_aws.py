@@ -0,0 +1,36 @@
+import os
+from functools import lru_cache
+
+import boto3
+from botocore.config import Config
+
+# Shared by every AWS client: pooled keep-alive connections + adaptive retries.
+# The region is resolved per client so a .env loaded after import still applies.
+CLIENT_CONFIG = Config(
+    max_pool_connections=64,
+    retries={"mode": "adaptive", "total_max_attempts": 5},
+    tcp_keepalive=True,
+)
+
+
+def _region() -> str:
+    return os.getenv("AWS_REGION", "us-east-1")
+
+
+@lru_cache(maxsize=1)
+def get_bedrock():
+    return boto3.client("bedrock-runtime", region_name=_region(), config=CLIENT_CONFIG)
+
+
+@lru_cache(maxsize=1)
+def get_ssm():
+    return boto3.client("ssm", region_name=_region(), config=CLIENT_CONFIG)
+
+
+def new_dynamodb_resource():
+    """
+    DynamoDB resource on its own session. Resources (and sessions) are not
+    thread-safe, so callers keep one per thread instead of sharing a cached one.
+    """
+    return boto3.session.Session().resource(
+        "dynamodb", region_name=_region(), config=CLIENT_CONFIG)
@@ -1,13 +1,16 @@
 import boto3
-import json
+import orjson
 import os
 import glob
-from opensearchpy import OpenSearch, RequestsHttpConnection
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from opensearchpy import OpenSearch, RequestsHttpConnection, helpers
 from requests_aws4auth import AWS4Auth
 
 from dotenv import load_dotenv
 load_dotenv()
 
+from app import _aws  # noqa: E402
+
 # ----------------------------
 # AWS + OpenSearch Setup
 # ----------------------------
@@ -36,10 +39,18 @@ client = OpenSearch(
     connection_class=RequestsHttpConnection,
 )
 
-bedrock = boto3.client("bedrock-runtime", region_name=region)
-
 INDEX_NAME = "runbooks"
 
+# Bulk ingest tuning
+BULK_CHUNK_SIZE = 500
+BULK_MAX_CHUNK_BYTES = 100 * 1024 * 1024
+# Corpora at least this large are sent with parallel_bulk
+PARALLEL_BULK_MIN_DOCS = int(os.getenv("PARALLEL_BULK_MIN_DOCS", "5000"))
+
+# Concurrent Titan embedding (Titan takes one input per InvokeModel call)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "16"))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "4"))
+
 
 # ----------------------------
 # Helpers
@@ -51,12 +62,24 @@ def create_index_if_missing():
         client.indices.create(
             index=INDEX_NAME,
             body={
-                "settings": {"index": {"knn": True}},  # enable kNN
+                "settings": {"index": {"knn": True, "knn.algo_param.ef_search": 100}},  # enable kNN
                 "mappings": {
                     "properties": {
                         "vector_field": {
                             "type": "knn_vector",
-                            "dimension": 1024  # Titan v2 output size
+                            "dimension": 1024,  # Titan v2 output size
+                            # FAISS HNSW with fp16 scalar quantization halves vector memory
+                            "method": {
+                                "name": "hnsw",
+                                "engine": "faiss",
+                                "space_type": "cosinesimil",
+                                "parameters": {
+                                    "m": 16,
+                                    "ef_construction": 100,
+                                    "ef_search": 100,
+                                    "encoder": {"name": "sq", "parameters": {"type": "fp16"}},
+                                },
+                            },
                         },
                         "id": {"type": "keyword"},
                         "issue": {"type": "text"},
@@ -75,24 +98,28 @@ def create_index_if_missing():
 
 def embed_text(text: str):
     """Generate Titan embedding for text."""
-    response = bedrock.invoke_model(
+    # Shared keep-alive client; its adaptive retry mode handles Bedrock throttling
+    response = _aws.get_bedrock().invoke_model(
         modelId="amazon.titan-embed-text-v2:0",
-        body=json.dumps({"inputText": text}),
+        body=orjson.dumps({"inputText": text}),
     )
-    resp_body = json.loads(response["body"].read().decode("utf-8"))
+    resp_body = orjson.loads(response["body"].read())
     embedding = resp_body.get(
         "embedding") or resp_body.get("embeddings", [])[0]
     return embedding
 
 
-def index_runbook(file_path: str):
-    """Index a single runbook JSON into OpenSearch."""
-    with open(file_path, "r") as f:
-        runbook = json.load(f)
+def load_runbook(file_path: str):
+    """Read a runbook JSON and return (runbook_id, runbook, text)."""
+    with open(file_path, "rb") as f:
+        runbook = orjson.loads(f.read())
 
     runbook_id = runbook.get("id") or os.path.basename(file_path)
-    text = json.dumps(runbook)
+    return runbook_id, runbook, orjson.dumps(runbook).decode()
+
 
+def build_action(runbook_id: str, runbook: dict, text: str):
+    """Embed a loaded runbook and build its bulk index action."""
     embedding = embed_text(text)
 
     doc = {
@@ -105,12 +132,57 @@ def index_runbook(file_path: str):
         "vector_field": embedding,
     }
 
-    client.index(index=INDEX_NAME, id=runbook_id, body=doc)
-    print(f"Indexed runbook {runbook_id}")
+    return {"_index": INDEX_NAME, "_id": runbook_id, "_source": doc}
+
+
+def index_runbook(file_path: str):
+    """Build the bulk index action for a single runbook JSON."""
+    return build_action(*load_runbook(file_path))
+
+
+def _completed(futures: dict, wait: bool):
+    """Pop finished embedding futures and yield their actions."""
+    done = as_completed(list(futures)) if wait else [
+        f for f in list(futures) if f.done()]
+    for future in done:
+        file = futures.pop(future)
+        try:
+            yield future.result()
+        except Exception as e:
+            print(f"Failed to index {file}: {e}")
+
+
+def generate_actions(files):
+    """Yield bulk actions through a read -> embed pipeline.
+
+    JSON reads run on an I/O pool and each loaded runbook is handed to the
+    embedding pool as soon as it is read; actions are yielded as embeddings
+    finish, so the bulk indexer starts while files are still loading.
+    Files that fail to load or embed are reported and skipped.
+    """
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as io_pool, \
+            ThreadPoolExecutor(max_workers=EMBED_WORKERS) as embed_pool:
+        loading = {io_pool.submit(load_runbook, file): file for file in files}
+        embedding = {}
+
+        for future in as_completed(loading):
+            file = loading[future]
+            try:
+                embedding[embed_pool.submit(build_action, *future.result())] = file
+            except Exception as e:
+                print(f"Failed to index {file}: {e}")
+            yield from _completed(embedding, wait=False)
+
+        yield from _completed(embedding, wait=True)
+
+
+def set_refresh_interval(interval: str):
+    client.indices.put_settings(
+        index=INDEX_NAME, body={"index": {"refresh_interval": interval}})
 
 
 def index_all_runbooks():
-    """Ingest all runbooks from app/runbooks/"""
+    """Ingest all runbooks from app/runbooks/ with the bulk API."""
     create_index_if_missing()
     files = glob.glob("app/runbooks/*.json")
 
@@ -118,11 +190,31 @@ def index_all_runbooks():
         print(" No runbooks found in app/runbooks/")
         return
 
-    for file in files:
-        try:
-            index_runbook(file)
-        except Exception as e:
-            print(f"Failed to index {file}: {e}")
+    # Disable refreshes while loading; restored once the bulk load finishes
+    set_refresh_interval("-1")
+    try:
+        if len(files) >= PARALLEL_BULK_MIN_DOCS:
+            success, failed = 0, 0
+            for ok, item in helpers.parallel_bulk(
+                    client, generate_actions(files), thread_count=8, queue_size=4,
+                    chunk_size=BULK_CHUNK_SIZE, max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+                    raise_on_error=False):
+                if ok:
+                    success += 1
+                else:
+                    failed += 1
+                    print(f"Failed to index: {item}")
+        else:
+            success, errors = helpers.bulk(
+                client, generate_actions(files), chunk_size=BULK_CHUNK_SIZE,
+                max_chunk_bytes=BULK_MAX_CHUNK_BYTES, raise_on_error=False)
+            failed = len(errors)
+            for item in errors:
+                print(f"Failed to index: {item}")
+    finally:
+        set_refresh_interval("1s")
+
+    print(f"Indexed {success} runbooks ({failed} failed)")
 
 
 if __name__ == "__main__":
@@ -1,26 +1,33 @@
 import os
 import time
+import asyncio
 import json
 import uuid
 import datetime
 import logging
-import re
-from decimal import Decimal
+import random
+import threading
+from decimal import Decimal, DecimalException, InvalidOperation
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import Any, Dict, Optional
 
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, constr, field_validator
+from pydantic import BaseModel, ConfigDict, ValidationError, constr, field_validator
 from enum import Enum
 from dotenv import load_dotenv
 
 import boto3
-from botocore.exceptions import ClientError
+import orjson
+from boto3.dynamodb.types import DYNAMODB_CONTEXT
+from botocore.exceptions import BotoCoreError, ClientError
 
 # CrewAI + LiteLLM
 from crewai import Agent, Task, Crew
 from litellm.exceptions import RateLimitError, AuthenticationError, APIError
 
 # Tools
+from app import _aws
 from app.tools import rag_tool, ssm_tool
 
 # ----------------------------
@@ -38,20 +45,22 @@ os.environ.setdefault("LITELLM_PROVIDER", os.getenv(
 # ----------------------------
 
 
-def convert_floats(obj: Any) -> Any:
-    if isinstance(obj, float):
-        return Decimal(str(obj))
-    if isinstance(obj, dict):
-        return {k: convert_floats(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [convert_floats(i) for i in obj]
-    return obj
+_audit_tables = threading.local()
 
 
 def get_audit_table():
-    return boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION", "us-east-1")).Table(
-        os.getenv("AUDIT_TABLE", "IncidentAudit")
-    )
+    """Audit Table for the calling thread; boto3 resources can't be shared."""
+    table = getattr(_audit_tables, "table", None)
+    if table is None:
+        table = _aws.new_dynamodb_resource().Table(
+            os.getenv("AUDIT_TABLE", "IncidentAudit"))
+        _audit_tables.table = table
+    return table
+
+
+def _put_audit_item(item: Dict):
+    # Resolve the table on the worker thread that performs the write
+    get_audit_table().put_item(Item=item)
 
 
 def assert_aws_credentials():
@@ -60,16 +69,10 @@ def assert_aws_credentials():
             "AWS_REGION", "us-east-1"))
         identity = sts.get_caller_identity()
         logger.info("AWS identity OK: %s", identity.get("Arn"))
-    except ClientError as e:
+    except (ClientError, BotoCoreError) as e:
         logger.exception("AWS credentials invalid or expired")
         raise RuntimeError("Fix AWS creds or use AWS_PROFILE.") from e
 
-
-try:
-    assert_aws_credentials()
-except RuntimeError as e:
-    logger.warning("AWS auth check failed: %s", str(e))
-
 # ----------------------------
 # Models
 # ----------------------------
@@ -89,15 +92,58 @@ logger.info("Models: classifier=%s rag=%s analyzer=%s executor=%s",
 # ----------------------------
 
 
+# Agent runs started per second across the process (0 disables the limiter).
+# One token is charged per crew kickoff, not per Bedrock request: a run may make
+# several LLM calls in its tool loop, and RAGTool's Titan embeddings are not
+# limited. Size it from the per-run call count against the Bedrock quota.
+AGENT_RUNS_PER_SECOND = float(os.getenv("AGENT_RUNS_PER_SECOND", "0"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every worker thread in the process."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+agent_run_limiter = (TokenBucket(AGENT_RUNS_PER_SECOND)
+                     if AGENT_RUNS_PER_SECOND > 0 else None)
+
+
 def exponential_backoff_retry(fn, retries=3, base_interval=1.0, max_interval=10.0,
-                              allowed_exceptions=(RateLimitError, APIError)):
+                              allowed_exceptions=(RateLimitError, APIError), limiter=None):
     last_exc = None
     for attempt in range(1, retries + 1):
+        if limiter is not None:
+            limiter.acquire()
         try:
             return fn()
         except allowed_exceptions as e:
             last_exc = e
-            wait = min(max_interval, base_interval * (2 ** (attempt - 1)))
+            cap = min(max_interval, base_interval * (2 ** (attempt - 1)))
+            if isinstance(e, RateLimitError):
+                # Full jitter spreads throttled workers across the whole window
+                wait = random.uniform(0, cap)
+            else:
+                # Server errors keep half the backoff as a floor
+                wait = cap / 2 + random.uniform(0, cap / 2)
             logger.warning("LLM call failed (attempt %d/%d): %s. Retrying in %.2fs",
                            attempt, retries, str(e), wait)
             time.sleep(wait)
@@ -111,23 +157,53 @@ def exponential_backoff_retry(fn, retries=3, base_interval=1.0, max_interval=10.
 # ----------------------------
 
 
+def _json_number(s: str) -> Optional[Decimal]:
+    """
+    Parse a JSON float as a Decimal DynamoDB can store: rounded through a
+    float like the baseline, and None when it is non-finite or out of range.
+    """
+    try:
+        d = DYNAMODB_CONTEXT.create_decimal(repr(float(s)))
+    except DecimalException:
+        return None
+    return d if d.is_finite() else None
+
+
+def _json_int(s: str) -> Optional[int]:
+    """Parse a JSON integer, or None when DynamoDB can't store it exactly."""
+    try:
+        DYNAMODB_CONTEXT.create_decimal(s)
+    except DecimalException:
+        return None
+    return int(s)
+
+
+# Decimal floats keep the parsed output DynamoDB-ready without a re-walk
+_json_decoder = json.JSONDecoder(parse_float=_json_number, parse_int=_json_int,
+                                 parse_constant=lambda _: None)
+
+
 def _parse_possible_json(val: Any) -> Dict:
     if not val:
         return {}
     if isinstance(val, dict):
         return val
-    if isinstance(val, str):
-        try:
-            return json.loads(val)
-        except Exception:
-            pass
+    if not isinstance(val, str):
+        return {}
+
+    try:
+        # Prompts ask for strict JSON, so the whole string usually parses
+        parsed = _json_decoder.decode(val)
+    except ValueError:
+        # Otherwise take the first object, ignoring surrounding prose
+        start = val.find("{")
+        if start == -1:
+            return {}
         try:
-            match = re.search(r"\{.*\}", val, re.DOTALL)
-            if match:
-                return json.loads(match.group())
-        except Exception:
+            parsed, _ = _json_decoder.raw_decode(val, start)
+        except ValueError:
             return {}
-    return {}
+    return parsed if isinstance(parsed, dict) else {}
 
 
 # ----------------------------
@@ -148,7 +224,25 @@ executor_agent = Agent(role="Fix Executor", goal="Execute automated fixes",
 # ----------------------------
 # FastAPI App
 # ----------------------------
-app = FastAPI(title="GenAI Incident Manager", version="1.0")
+
+
+@lru_cache(maxsize=1)
+def check_aws_credentials_once():
+    """Log-only credential check; cached so it runs once per process."""
+    try:
+        assert_aws_credentials()
+    except RuntimeError as e:
+        logger.warning("AWS auth check failed: %s", str(e))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Mangum enters the lifespan on every invocation, hence the cached check
+    await asyncio.to_thread(check_aws_credentials_once)
+    yield
+
+
+app = FastAPI(title="GenAI Incident Manager", version="1.0", lifespan=lifespan)
 
 
 class SeverityEnum(str, Enum):
@@ -158,15 +252,21 @@ class SeverityEnum(str, Enum):
 
 
 class Alert(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, extra="ignore",
+                              use_enum_values=True)
+
     incident_id: Optional[str] = None
     description: constr(min_length=1)
     severity: SeverityEnum
     metrics: dict = {}
 
-    @field_validator("description")
+    @field_validator("description", mode="before")
+    @classmethod
     def description_not_blank(cls, v):
-        if not v.strip():
-            raise ValueError("Description must not be blank")
+        if isinstance(v, str):
+            v = v.strip()
+            if not v:
+                raise ValueError("Description must not be blank")
         return v
 
 
@@ -179,70 +279,140 @@ class ApproveRequest(BaseModel):
 # ----------------------------
 
 
-@app.post("/process_alert")
-async def process_alert(alert: Alert):
+def classifier_task(agent: Agent) -> Task:
+    return Task(description=(
+        "You are an **Incident Classifier Agent**. "
+        "Follow these steps:\n"
+        "1. Read the incident description carefully.\n"
+        "2. Decide if it is most related to: (a) database, (b) network, or (c) application.\n"
+        "3. If multiple categories seem possible, pick the most likely one (never say 'uncertain').\n"
+        "4. Respond with exactly one lowercase word: `database`, `network`, or `application`.\n"
+        "Do not add explanations or extra text.\n"
+        "Incident alert: {alert}"
+    ), expected_output="database OR network OR application", agent=agent)
+
+
+def rag_task(agent: Agent) -> Task:
+    return Task(description=(
+        "You are a **Runbook Selector Agent**.\n"
+        "Steps:\n"
+        "1. Take the incident description.\n"
+        "2. Call the RAG_Tool to retrieve the most relevant runbook(s).\n"
+        "3. Always return the raw JSON runbook content exactly as retrieved.\n"
+        "4. If no runbook is found, return `{}`.\n"
+        "Do not generate your own runbook; rely only on RAG_Tool results.\n"
+        "Incident alert: {alert}"
+    ), expected_output="Runbook JSON content", agent=agent)
+
+
+def analyzer_task(agent: Agent) -> Task:
+    return Task(description=(
+        "You are a **Resolution Analyzer Agent**.\n"
+        "Incident alert: {alert}\n"
+        "Incident type: {incident_type}\n"
+        "Runbooks: {runbooks}\n"
+        "Think step by step:\n"
+        "1. Combine the incident type + runbook JSON.\n"
+        "2. Identify the issue.\n"
+        "3. Identify the most likely root cause.\n"
+        "4. Assess the business/system impact.\n"
+        "5. Suggest specific, actionable resolution steps.\n"
+        "6. Assign a numeric confidence score (0–1).\n"
+        "Return a **strict JSON** with keys:\n"
+        "{\n"
+        "  \"issue\": \"...\",\n"
+        "  \"root_cause\": \"...\",\n"
+        "  \"impact\": \"...\",\n"
+        "  \"resolution\": \"...\",\n"
+        "  \"confidence\": 0.xx\n"
+        "}\n"
+        "No extra text outside the JSON."
+    ), expected_output="Valid JSON {issue, root_cause, impact, resolution, confidence}", agent=agent)
+
+
+def executor_task(agent: Agent) -> Task:
+    return Task(description=(
+        "You are a **Fix Executor Agent**.\n"
+        "Analyzer output: {analysis}\n"
+        "Steps:\n"
+        "1. Read the analyzer output JSON.\n"
+        "2. If `confidence` > 0.8, call SSM_Execute tool to apply the fix.\n"
+        "3. If confidence ≤ 0.8, skip execution.\n"
+        "4. Always return valid JSON like:\n"
+        "   - If executed: `{ \"executed\": true, \"command_id\": \"...\" }`\n"
+        "   - If skipped: `{ \"executed\": false, \"note\": \"Skipped due to low confidence\" }`"
+    ), expected_output="Execution result JSON", agent=agent)
+
+
+# Executor runs fixes only above this analyzer confidence
+EXECUTION_THRESHOLD = Decimal("0.8")
+SKIPPED_EXECUTION = orjson.dumps(
+    {"executed": False, "note": "Skipped due to low confidence"}).decode()
+
+
+def _confidence(output: Dict) -> Decimal:
+    try:
+        d = Decimal(str(output.get("confidence", "0.7")))
+    except InvalidOperation:
+        return Decimal("0")
+    # NaN can't be ordered against the threshold
+    return d if d.is_finite() else Decimal("0")
+
+
+def run_agent(agent: Agent, make_task, inputs: Dict) -> str:
+    """
+    Run a single-task crew with retries and return its raw output. Crews
+    mutate their agents while running, so each run works on its own copy.
+    """
+    agent = agent.copy()
+    task = make_task(agent)
+    crew = Crew(agents=[agent], tasks=[task], verbose=True,
+                process="sequential", max_concurrency=1)
+    result = exponential_backoff_retry(lambda: crew.kickoff(inputs=inputs),
+                                       limiter=agent_run_limiter)
+    raw_output = getattr(result, "raw", None) or str(result)
+    logger.info("📥 Agent %s raw output: %s", agent.role, raw_output)
+    return raw_output
+
+
+async def resolve_alert(alert: Alert, audit_items: Optional[list] = None,
+                        runbooks: Optional[str] = None) -> Dict:
+    """
+    Run the agent pipeline for one alert, audit it and return the decision.
+    When audit_items is given the audit record is appended to it for the
+    caller to batch-write instead of being written immediately. Prefetched
+    runbooks replace the Runbook Selector stage.
+    """
     incident_id = alert.incident_id or str(uuid.uuid4())
     logger.info("🚨 Processing alert %s", incident_id)
-
-    tasks = [
-        Task(description=(
-            "You are an **Incident Classifier Agent**. "
-            "Follow these steps:\n"
-            "1. Read the incident description carefully.\n"
-            "2. Decide if it is most related to: (a) database, (b) network, or (c) application.\n"
-            "3. If multiple categories seem possible, pick the most likely one (never say 'uncertain').\n"
-            "4. Respond with exactly one lowercase word: `database`, `network`, or `application`.\n"
-            "Do not add explanations or extra text."
-        ), expected_output="database OR network OR application", agent=classifier_agent),
-
-        Task(description=(
-            "You are a **Runbook Selector Agent**.\n"
-            "Steps:\n"
-            "1. Take the incident description.\n"
-            "2. Call the RAG_Tool to retrieve the most relevant runbook(s).\n"
-            "3. Always return the raw JSON runbook content exactly as retrieved.\n"
-            "4. If no runbook is found, return `{}`.\n"
-            "Do not generate your own runbook; rely only on RAG_Tool results."
-        ), expected_output="Runbook JSON content", agent=rag_agent),
-
-        Task(description=(
-            "You are a **Resolution Analyzer Agent**.\n"
-            "Think step by step:\n"
-            "1. Combine the incident type + runbook JSON.\n"
-            "2. Identify the issue.\n"
-            "3. Identify the most likely root cause.\n"
-            "4. Assess the business/system impact.\n"
-            "5. Suggest specific, actionable resolution steps.\n"
-            "6. Assign a numeric confidence score (0–1).\n"
-            "Return a **strict JSON** with keys:\n"
-            "{\n"
-            "  \"issue\": \"...\",\n"
-            "  \"root_cause\": \"...\",\n"
-            "  \"impact\": \"...\",\n"
-            "  \"resolution\": \"...\",\n"
-            "  \"confidence\": 0.xx\n"
-            "}\n"
-            "No extra text outside the JSON."
-        ), expected_output="Valid JSON {issue, root_cause, impact, resolution, confidence}", agent=analyzer_agent),
-
-        Task(description=(
-            "You are a **Fix Executor Agent**.\n"
-            "Steps:\n"
-            "1. Read the analyzer output JSON.\n"
-            "2. If `confidence` > 0.8, call SSM_Execute tool to apply the fix.\n"
-            "3. If confidence ≤ 0.8, skip execution.\n"
-            "4. Always return valid JSON like:\n"
-            "   - If executed: `{ \"executed\": true, \"command_id\": \"...\" }`\n"
-            "   - If skipped: `{ \"executed\": false, \"note\": \"Skipped due to low confidence\" }`"
-        ), expected_output="Execution result JSON", agent=executor_agent),
-    ]
-
-    crew = Crew(agents=[classifier_agent, rag_agent, analyzer_agent, executor_agent],
-                tasks=tasks, verbose=True, process="sequential", max_concurrency=1)
+    inputs = {"alert": alert.model_dump()}
 
     try:
-        result = exponential_backoff_retry(
-            lambda: crew.kickoff(inputs={"alert": alert.dict()}))
+        # Classification and runbook retrieval both only need the raw alert.
+        # Crew runs are blocking, so they execute on worker threads to keep
+        # the event loop free for other requests.
+        if runbooks is None:
+            incident_type, runbooks = await asyncio.gather(
+                asyncio.to_thread(run_agent, classifier_agent,
+                                  classifier_task, inputs),
+                asyncio.to_thread(run_agent, rag_agent, rag_task, inputs),
+            )
+        else:
+            # Runbooks were prefetched by the caller; skip the retrieval crew
+            incident_type = await asyncio.to_thread(
+                run_agent, classifier_agent, classifier_task, inputs)
+        analysis = await asyncio.to_thread(
+            run_agent, analyzer_agent, analyzer_task,
+            {**inputs, "incident_type": incident_type, "runbooks": runbooks})
+        parsed_analyzer = _parse_possible_json(analysis)
+
+        # Only pay for the executor LLM call when a fix would actually run
+        if _confidence(parsed_analyzer) > EXECUTION_THRESHOLD:
+            execution = await asyncio.to_thread(
+                run_agent, executor_agent, executor_task, {"analysis": analysis})
+        else:
+            logger.info("⏭️ Skipping executor for %s (low confidence)", incident_id)
+            execution = SKIPPED_EXECUTION
     except (RateLimitError, APIError) as e:
         logger.exception("Bedrock rate limit/service error: %s", e)
         return {"status": "pending_human", "incident_id": incident_id,
@@ -251,26 +421,11 @@ async def process_alert(alert: Alert):
                                "confidence": 0.0, "executed": False}}
 
     # ---------------- Extract outputs ----------------
-    parsed_analyzer, parsed_executor = {}, {}
-
-    try:
-        for t in getattr(result, "tasks_output", []):
-            agent_name = getattr(t, "agent", "") or ""
-            raw_output = getattr(t, "raw", None) or getattr(t, "output", None)
-            if not raw_output:
-                raw_output = str(t)
-            logger.info("📥 Agent %s raw output: %s", agent_name, raw_output)
-            parsed_json = _parse_possible_json(raw_output)
-            if "Resolution Generator" in agent_name:
-                parsed_analyzer = parsed_json
-            if "Fix Executor" in agent_name:
-                parsed_executor = parsed_json
-    except Exception as e:
-        logger.warning("Failed to extract task outputs: %s", e)
+    parsed_executor = _parse_possible_json(execution)
 
     # ---------------- Merge resolution ----------------
     resolution = {"issue": "Unknown", "root_cause": "Unknown", "impact": "Unknown",
-                  "resolution": "Manual investigation required", "confidence": 0.7, "executed": False}
+                  "resolution": "Manual investigation required", "confidence": Decimal("0.7"), "executed": False}
 
     if parsed_analyzer:
         resolution.update(parsed_analyzer)
@@ -281,25 +436,120 @@ async def process_alert(alert: Alert):
         resolution["command_id"] = ",".join(resolution["command_id"])
 
     # ---------------- Final decision ----------------
-    confidence = float(resolution.get("confidence", 0.7))
+    confidence = _confidence(resolution)
     if resolution.get("executed") is True:
         status = "resolved"
-        resolution["confidence"] = max(confidence, 0.95)
-    elif confidence < 0.8:
+        confidence = max(confidence, Decimal("0.95"))
+    elif confidence <= EXECUTION_THRESHOLD:
+        # Same boundary as the executor gate: no fix ran, so a human decides
         status = "pending_human"
     else:
         status = "resolved"
+    resolution["confidence"] = confidence
 
-    get_audit_table().put_item(Item=convert_floats({
+    audit_item = {
         "incident_id": incident_id,
         "timestamp": datetime.datetime.now().isoformat(),
         "resolution": resolution,
-        "actions": str(result),
+        "actions": orjson.dumps({"incident_type": incident_type, "runbooks": runbooks,
+                                 "analysis": analysis, "execution": execution}).decode(),
         "human_intervention": (status == "pending_human"),
-    }))
+    }
+    if audit_items is None:
+        await asyncio.to_thread(_put_audit_item, audit_item)
+    else:
+        audit_items.append(audit_item)
 
     return {"status": status, "incident_id": incident_id, "resolution": resolution}
 
+
+@app.post("/process_alert")
+async def process_alert(alert: Alert):
+    return await resolve_alert(alert)
+
+# ----------------------------
+# SQS batch
+# ----------------------------
+
+
+def _alert_from_sqs_body(body: str) -> Alert:
+    """
+    Alert from an SQS message body. The AlertRule EventBridge target forwards
+    whole CloudWatch events, so an event envelope is mapped onto an Alert;
+    bodies that are already Alert JSON are validated as-is.
+    """
+    payload = orjson.loads(body)
+    if isinstance(payload, dict) and "detail-type" in payload:
+        detail = payload.get("detail") or {}
+        state = detail.get("state") or {}
+        name = detail.get("alarmName") or payload["detail-type"]
+        payload = {
+            "incident_id": payload.get("id"),
+            "description": f"{name}: {state['reason']}" if state.get("reason") else name,
+            "severity": "high" if state.get("value") == "ALARM" else "low",
+            "metrics": detail.get("configuration") or {},
+        }
+    return Alert.model_validate(payload)
+
+
+def process_sqs_batch(records: list) -> Dict:
+    """
+    Handle an SQS batch from the event source mapping. Runbooks for every
+    alert are fetched up front with one batched RAG lookup and handed to the
+    analyzer directly, so no per-alert retrieval crew runs. Failed messages are reported
+    back individually so only they are retried. Audit records for the whole
+    batch are flushed together with BatchWriteItem.
+    """
+    alerts, failures = [], []
+    for record in records:
+        try:
+            alerts.append((record["messageId"],
+                           _alert_from_sqs_body(record["body"])))
+        except (ValidationError, orjson.JSONDecodeError) as e:
+            logger.warning("Invalid alert in SQS message %s: %s",
+                           record.get("messageId"), e)
+            failures.append({"itemIdentifier": record.get("messageId")})
+
+    if alerts:
+        prefetched = rag_tool.batch_run([alert.description for _, alert in alerts])
+        failures.extend(asyncio.run(_resolve_batch(alerts, prefetched)))
+
+    return {"batchItemFailures": failures}
+
+
+async def _resolve_batch(alerts: list, prefetched: list) -> list:
+    audit_items = []
+    # Alerts resolve concurrently; an empty lookup (no hits or a failed
+    # search) falls back to the RAG crew
+    results = await asyncio.gather(
+        *(resolve_alert(alert, audit_items=audit_items,
+                        runbooks="\n\n".join(docs) if docs else None)
+          for (_, alert), docs in zip(alerts, prefetched)),
+        return_exceptions=True)
+
+    failures = []
+    for (message_id, _), result in zip(alerts, results):
+        if isinstance(result, Exception):
+            logger.error("Failed to process SQS message %s", message_id,
+                         exc_info=result)
+            failures.append({"itemIdentifier": message_id})
+
+    try:
+        with get_audit_table().batch_writer() as writer:
+            for item in audit_items:
+                writer.put_item(Item=item)
+    except Exception:
+        # The alerts have already been acted on (possibly SSM fixes), so an
+        # audit failure must not fail the messages and re-drive the pipeline
+        logger.exception("Batch audit write failed; writing records one by one")
+        for item in audit_items:
+            try:
+                get_audit_table().put_item(Item=item)
+            except Exception:
+                logger.exception("Failed to write audit record for incident %s",
+                                 item["incident_id"])
+    return failures
+
 # ----------------------------
 # Approve endpoint
 # ----------------------------
@@ -316,9 +566,22 @@ async def approve(incident_id: str, request: ApproveRequest):
 # ----------------------------
 try:
     from mangum import Mangum
-    handler = Mangum(app)
+    asgi_handler = Mangum(app)
 except Exception:
-    handler = None
+    asgi_handler = None
+
+
+def _is_sqs_event(event: Any) -> bool:
+    records = event.get("Records") if isinstance(event, dict) else None
+    return bool(records) and records[0].get("eventSource") == "aws:sqs"
+
+
+def handler(event, context):
+    if _is_sqs_event(event):
+        return process_sqs_batch(event["Records"])
+    if asgi_handler is None:
+        raise RuntimeError("mangum is required to serve API Gateway events")
+    return asgi_handler(event, context)
 
 if __name__ == "__main__":
     import uvicorn
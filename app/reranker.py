@@ -0,0 +1,101 @@
+import os
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("Reranker")
+
+ONNX_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+MAX_LENGTH = 512
+
+
+class OnnxCrossEncoder:
+    """
+    Int8-quantized ONNX Runtime drop-in for sentence_transformers.CrossEncoder.
+    Only predict() is provided; all pairs are scored in one session.run.
+    """
+
+    def __init__(self, model_dir: str):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE),
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(
+            os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=MAX_LENGTH)
+        self.tokenizer.enable_padding()
+
+    def predict(self, pairs):
+        if not pairs:
+            return np.array([], dtype=np.float32)
+
+        encodings = self.tokenizer.encode_batch(
+            [(query, doc) for query, doc in pairs])
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        inputs = {k: v for k, v in inputs.items() if k in self.input_names}
+
+        logits = self.session.run(None, inputs)[0]
+        # Single-label cross-encoders score with a sigmoid, like CrossEncoder.predict
+        return 1.0 / (1.0 + np.exp(-logits[:, 0]))
+
+
+def has_onnx_model(model_dir) -> bool:
+    return bool(model_dir) and os.path.exists(os.path.join(model_dir, ONNX_MODEL_FILE))
+
+
+def export_quantized(model_name: str, output_dir: str):
+    """
+    One-time export: HF cross-encoder -> ONNX -> dynamic int8 (QUInt8) weights.
+    Needs torch, sentence-transformers and onnx, which are not required at runtime.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import CrossEncoder
+
+    os.makedirs(output_dir, exist_ok=True)
+    cross_encoder = CrossEncoder(model_name, device="cpu")
+    model = cross_encoder.model.eval()
+    tokenizer = cross_encoder.tokenizer
+
+    sample = tokenizer([("query", "document")], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids")
+                   if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+
+    quantize_dynamic(fp32_path, os.path.join(output_dir, ONNX_MODEL_FILE),
+                     weight_type=QuantType.QUInt8)
+    os.remove(fp32_path)
+    tokenizer.save_pretrained(output_dir)
+    logger.info("Exported quantized reranker to %s", output_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    export_quantized(
+        os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+        os.getenv("RERANKER_ONNX_DIR", "models/reranker"),
+    )
@@ -1,19 +1,40 @@
 from botocore.exceptions import ClientError
 import os
-import json
 import boto3
+import orjson
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
 from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-from sentence_transformers import CrossEncoder
 from crewai.tools import BaseTool
+from app import _aws
+from app.reranker import OnnxCrossEncoder, has_onnx_model
 
 logger = logging.getLogger("RAG_Tool")
 logger.setLevel(logging.INFO)
 
+RAG_CACHE_SIMILARITY = float(os.getenv("RAG_CACHE_SIMILARITY", "0.92"))
+RAG_CACHE_MAX_ENTRIES = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1024"))
+# Cached results expire so a warm process picks up re-ingested runbooks (0 disables)
+RAG_CACHE_TTL_SECONDS = float(os.getenv("RAG_CACHE_TTL_SECONDS", "900"))
 
+RERANKER_MODEL = os.getenv(
+    "RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Pre-baked weights (e.g. /opt/models in the Lambda image); None uses the HF cache
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR")
+# Directory holding the int8 ONNX export from app/reranker.py
+RERANKER_ONNX_DIR = os.getenv("RERANKER_ONNX_DIR")
+
+
+@lru_cache(maxsize=1)
 def get_opensearch_client():
     """
     Returns an OpenSearch client with SigV4 authentication.
+    Built once per process so the credential chain is resolved a single time
+    and HTTPS connections are pooled; botocore's credentials refresh themselves.
     """
     host = os.getenv(
         "OPENSEARCH_URL")  # e.g. search-incident-mgmt-xxxx.us-east-1.es.amazonaws.com
@@ -32,47 +53,226 @@ def get_opensearch_client():
         use_ssl=True,
         verify_certs=True,
         connection_class=RequestsHttpConnection,
+        pool_maxsize=32,
     )
 
 
+@lru_cache(maxsize=1)
+def get_cross_encoder():
+    """
+    Loads the reranker once per process; later calls reuse the same model.
+    Prefers the quantized ONNX export when RERANKER_ONNX_DIR has one.
+    """
+    if has_onnx_model(RERANKER_ONNX_DIR):
+        logger.info("Loading ONNX reranker from %s", RERANKER_ONNX_DIR)
+        return OnnxCrossEncoder(RERANKER_ONNX_DIR)
+    # Imported lazily: the Lambda image ships only the ONNX runtime, not torch
+    from sentence_transformers import CrossEncoder
+
+    logger.info("Loading reranker %s", RERANKER_MODEL)
+    return CrossEncoder(RERANKER_MODEL, device="cpu", cache_dir=MODEL_CACHE_DIR)
+
+
+class SemanticCache:
+    """
+    In-process cache of reranked runbooks keyed by query embedding.
+    Exact query strings hit first; otherwise the nearest cached embedding
+    is used when its cosine similarity clears the threshold. Entries older
+    than ttl seconds are dropped.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, ttl: float = 0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._exact = {}
+            self._queries = []
+            self._vectors = None
+            self._results = []
+            self._added = []
+
+    def _evict_oldest(self):
+        query, docs = self._queries.pop(0), self._results.pop(0)
+        # A newer entry for the same query may have replaced the exact mapping
+        if self._exact.get(query) is docs:
+            del self._exact[query]
+        self._added.pop(0)
+        self._vectors = self._vectors[1:] if len(self._results) else None
+
+    def _evict_expired(self):
+        # Entries are kept in insertion order, so expired ones are at the front
+        if self.ttl <= 0:
+            return
+        cutoff = time.monotonic() - self.ttl
+        while self._added and self._added[0] < cutoff:
+            self._evict_oldest()
+
+    def get_exact(self, query: str):
+        with self._lock:
+            self._evict_expired()
+            return self._exact.get(query)
+
+    def search(self, vector: np.ndarray):
+        with self._lock:
+            self._evict_expired()
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                return None
+            scores = self._vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self._results[best]
+        return None
+
+    def add(self, query: str, vector: np.ndarray, docs: list):
+        docs = tuple(docs)
+        with self._lock:
+            if self._vectors is not None and self._vectors.shape[1] != vector.shape[0]:
+                self._exact, self._queries, self._vectors, self._results, self._added = \
+                    {}, [], None, [], []
+            self._evict_expired()
+            if len(self._results) >= self.max_entries:
+                self._evict_oldest()
+            self._exact[query] = docs
+            self._queries.append(query)
+            self._results.append(docs)
+            self._added.append(time.monotonic())
+            row = vector[np.newaxis, :]
+            self._vectors = row if self._vectors is None else np.vstack(
+                [self._vectors, row])
+
+
+semantic_cache = SemanticCache(
+    RAG_CACHE_SIMILARITY, RAG_CACHE_MAX_ENTRIES, RAG_CACHE_TTL_SECONDS)
+
+
+def clear_caches():
+    """Drop all cached RAG state (used between tests)."""
+    semantic_cache.clear()
+    get_cross_encoder.cache_clear()
+    get_opensearch_client.cache_clear()
+    _cached_embedding.cache_clear()
+    _seeded_embeddings.clear()
+
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+INDEX_NAME = "runbooks"
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "16"))
+EMBED_CACHE_SIZE = 2048
+
+
+def _embed_query(query: str) -> list:
+    """Embed a query with Bedrock Titan."""
+    response = _aws.get_bedrock().invoke_model(
+        modelId="amazon.titan-embed-text-v2:0",
+        body=orjson.dumps({"inputText": query}),
+        contentType="application/json",
+        accept="application/json"
+    )
+    resp_body = orjson.loads(response["body"].read())
+    return resp_body.get("embedding", [])
+
+
+@lru_cache(maxsize=EMBED_CACHE_SIZE)
+def _cached_embedding(normalized_query: str) -> tuple:
+    embedding = _embed_query(normalized_query)
+    if not embedding:
+        # Raise rather than return so empty results are never cached
+        raise ValueError("No embedding returned for query")
+    return tuple(embedding)
+
+
+# Precomputed embeddings that bypass Bedrock entirely (see seed_embedding)
+_seeded_embeddings: dict = {}
+
+
+def seed_embedding(query: str, embedding) -> None:
+    """Register a precomputed embedding for query, e.g. known alert texts or tests."""
+    _seeded_embeddings[query.strip().lower()] = tuple(embedding)
+
+
+def embed_query(query: str) -> tuple:
+    """Titan embedding for a query, memoized on its normalized text."""
+    normalized = query.strip().lower()
+    seeded = _seeded_embeddings.get(normalized)
+    if seeded is not None:
+        return seeded
+    return _cached_embedding(normalized)
+
+
+def _embed_or_empty(query: str) -> tuple:
+    try:
+        return embed_query(query)
+    except ValueError:
+        return ()
+
+
+def _knn_query(query_embedding: list) -> dict:
+    return {
+        "size": 10,
+        "query": {
+            "knn": {
+                "vector_field": {
+                    "vector": list(query_embedding),
+                    "k": 10,
+                }
+            }
+        }
+    }
+
+
+def _rerank(query: str, docs: list) -> list:
+    """Rerank docs with the CrossEncoder and keep the top 3."""
+    if len(docs) < 2:
+        # Nothing to reorder; skip the model forward pass
+        return list(docs)
+    cross_encoder = get_cross_encoder()
+    pairs = [(query, doc) for doc in docs]
+    scores = cross_encoder.predict(pairs)
+
+    reranked = sorted(zip(docs, scores),
+                      key=lambda x: x[1], reverse=True)[:3]
+
+    return [doc for doc, _ in reranked]
+
+
 class RAGTool(BaseTool):
     name: str = "RAG_Tool"
     description: str = "Retrieve and rerank runbooks from OpenSearch"
 
     def _run(self, query: str) -> list:
+        cached = semantic_cache.get_exact(query)
+        if cached is not None:
+            return list(cached)
+
         try:
             client = get_opensearch_client()
 
             # Step 1: Embed query with Bedrock Titan
-            bedrock = boto3.client(
-                "bedrock-runtime", region_name=os.getenv("AWS_REGION", "us-east-1"))
-            response = bedrock.invoke_model(
-                modelId="amazon.titan-embed-text-v2:0",
-                body=json.dumps({"inputText": query}),
-                contentType="application/json",
-                accept="application/json"
-            )
-            resp_body = json.loads(response["body"].read().decode("utf-8"))
-            query_embedding = resp_body.get("embedding", [])
+            query_embedding = _embed_or_empty(query)
 
             if not query_embedding:
                 logger.warning("No embedding returned for query")
                 return []
 
-            # Step 2: Search OpenSearch
-            query_body = {
-                "size": 10,
-                "query": {
-                    "knn": {
-                        "vector_field": {
-                            "vector": query_embedding,
-                            "k": 10,
-                        }
-                    }
-                }
-            }
+            query_vector = _normalize(query_embedding)
+            cached = semantic_cache.search(query_vector)
+            if cached is not None:
+                logger.info("Semantic cache hit for query")
+                return list(cached)
 
-            search_response = client.search(index="runbooks", body=query_body)
+            # Step 2: Search OpenSearch
+            search_response = client.search(
+                index=INDEX_NAME, body=_knn_query(query_embedding))
             docs = [hit["_source"]["content"]
                     for hit in search_response["hits"]["hits"]]
 
@@ -81,20 +281,75 @@ class RAGTool(BaseTool):
                 return []
 
             # Step 3: Rerank with CrossEncoder
-            cross_encoder = CrossEncoder(
-                "cross-encoder/ms-marco-MiniLM-L-6-v2")
-            pairs = [(query, doc) for doc in docs]
-            scores = cross_encoder.predict(pairs)
-
-            reranked = sorted(zip(docs, scores),
-                              key=lambda x: x[1], reverse=True)[:3]
-
-            return [doc for doc, _ in reranked]
+            results = _rerank(query, docs)
+            semantic_cache.add(query, query_vector, results)
+            return results
 
         except Exception as e:
             logger.error("RAG_Tool failed: %s", e, exc_info=True)
             return []
 
+    def batch_run(self, queries: list) -> list:
+        """
+        Retrieve runbooks for several queries at once: embeddings are fetched
+        concurrently and all kNN searches go out in a single msearch request.
+        Returns one result list per query, in order.
+        """
+        results = [None] * len(queries)
+        for i, query in enumerate(queries):
+            cached = semantic_cache.get_exact(query)
+            if cached is not None:
+                results[i] = list(cached)
+
+        pending = [i for i, r in enumerate(results) if r is None]
+        if not pending:
+            return results
+
+        try:
+            client = get_opensearch_client()
+
+            with ThreadPoolExecutor(max_workers=min(EMBED_WORKERS, len(pending))) as pool:
+                embeddings = list(pool.map(
+                    lambda i: _embed_or_empty(queries[i]), pending))
+
+            to_search = []
+            for i, query_embedding in zip(pending, embeddings):
+                if not query_embedding:
+                    logger.warning("No embedding returned for query")
+                    results[i] = []
+                    continue
+                query_vector = _normalize(query_embedding)
+                cached = semantic_cache.search(query_vector)
+                if cached is not None:
+                    results[i] = list(cached)
+                else:
+                    to_search.append((i, query_embedding, query_vector))
+
+            if to_search:
+                body = []
+                for _, query_embedding, _ in to_search:
+                    body.append({"index": INDEX_NAME})
+                    body.append(_knn_query(query_embedding))
+                responses = client.msearch(body=body)["responses"]
+
+                for (i, _, query_vector), response in zip(to_search, responses):
+                    if "error" in response:
+                        logger.error("RAG_Tool msearch item failed: %s",
+                                     response["error"])
+                        results[i] = []
+                        continue
+                    docs = [hit["_source"]["content"]
+                            for hit in response["hits"]["hits"]]
+                    if not docs:
+                        results[i] = []
+                        continue
+                    results[i] = _rerank(queries[i], docs)
+                    semantic_cache.add(queries[i], query_vector, results[i])
+
+        except Exception as e:
+            logger.error("RAG_Tool batch failed: %s", e, exc_info=True)
+
+        return [r if r is not None else [] for r in results]
 
 
 rag_tool = RAGTool()
@@ -117,8 +372,7 @@ class SSMExecuteTool(BaseTool):
 
         # Otherwise, actually call AWS SSM
         try:
-            ssm = boto3.client("ssm", region_name="us-east-1")
-            response = ssm.send_command(
+            response = _aws.get_ssm().send_command(
                 InstanceIds=["i-1234567890abcdef0"],  # Replace in production
                 DocumentName="AWS-RunShellScript",
                 Parameters={"commands": [command]},
@@ -37,7 +37,10 @@ class IncidentMgmtStack(Stack):
                                      )
 
         opensearch_domain = opensearch.Domain(self, "RunbooksDomain",
-                                              version=opensearch.EngineVersion.OPENSEARCH_2_11,
+                                              # 2.19+: FAISS cosinesimil + fp16 SQ for the runbooks index
+                                              version=opensearch.EngineVersion.open_search(
+                                                  "2.19"),
+                                              enable_version_upgrade=True,
                                               capacity=opensearch.CapacityConfig(
                                                   data_nodes=3,
                                                   data_node_instance_type="r6g.large.search",
@@ -50,19 +53,18 @@ class IncidentMgmtStack(Stack):
                                               node_to_node_encryption=True
                                               )
 
-        process_lambda = _lambda.Function(self, "ProcessLambda",
-                                          runtime=_lambda.Runtime.PYTHON_3_12,
-                                          handler="main.handler",
-                                          code=_lambda.Code.from_asset(
-                                              "../app"),
-                                          timeout=Duration.minutes(5),
-                                          memory_size=512,
-                                          environment={
-                                              "OPENSEARCH_URL": f"https://{opensearch_domain.domain_endpoint}",
-                                              "AUDIT_TABLE": audit_table.table_name
-                                          },
-                                          tracing=_lambda.Tracing.ACTIVE
-                                          )
+        # Container image bundles the quantized ONNX reranker (see ../Dockerfile)
+        process_lambda = _lambda.DockerImageFunction(self, "ProcessLambda",
+                                                     code=_lambda.DockerImageCode.from_image_asset(
+                                                         "..", exclude=["cdk", "terraform", ".git", "tests"]),
+                                                     timeout=Duration.minutes(5),
+                                                     memory_size=3008,
+                                                     environment={
+                                                         "OPENSEARCH_URL": f"https://{opensearch_domain.domain_endpoint}",
+                                                         "AUDIT_TABLE": audit_table.table_name
+                                                     },
+                                                     tracing=_lambda.Tracing.ACTIVE
+                                                     )
         audit_table.grant_read_write_data(process_lambda)
         opensearch_domain.grant_read_write(process_lambda)
         process_lambda.add_to_role_policy(iam.PolicyStatement(
@@ -77,7 +79,8 @@ class IncidentMgmtStack(Stack):
         queue = sqs.Queue(self, "AlertQueue", dead_letter_queue=sqs.DeadLetterQueue(
             max_receive_count=3, queue=sqs.Queue(self, "AlertDLQ")))
         process_lambda.add_event_source_mapping(
-            "SQSMapping", event_source_arn=queue.queue_arn, batch_size=10)
+            "SQSMapping", event_source_arn=queue.queue_arn, batch_size=10,
+            report_batch_item_failures=True)
         queue.grant_consume_messages(process_lambda)
 
         rule = events.Rule(self, "AlertRule",
@@ -1,43 +1,122 @@
-import pytest
-from fastapi.testclient import TestClient
-from app.main import app
-from unittest.mock import MagicMock
-import boto3
-from moto import mock_aws
-import io
-import json
+import os
+import sys
+import types
+from contextlib import ExitStack, contextmanager
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
 
+# ----------------------------
+# Identical offline AWS settings for every xdist worker, set before any
+# boto3 client is built.
+# ----------------------------
+os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+os.environ.setdefault("OPENSEARCH_URL", "search.test")
 
 # ----------------------------
-# FastAPI test client
+# sentence_transformers stub: installed before app.tools is imported so
+# torch/transformers never load during the tests
 # ----------------------------
-@pytest.fixture
-def client():
-    return TestClient(app)
+CrossEncoderStub = MagicMock(name="CrossEncoder")
+CrossEncoderStub.return_value.predict.return_value = [0.9, 0.1]
+sys.modules["sentence_transformers"] = types.ModuleType("sentence_transformers")
+sys.modules["sentence_transformers"].CrossEncoder = CrossEncoderStub
+
+
+# ----------------------------
+# crewai stub: Agent/Task/Crew/BaseTool stand-ins so the real package (and
+# its LangChain/LLM dependency tree) is never imported. Crew.kickoff returns
+# "{}" unless a test monkeypatches it.
+# ----------------------------
+class _CrewObject:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def copy(self):
+        return type(self)(**self.__dict__)
+
+
+class _Crew(_CrewObject):
+    def kickoff(self, inputs=None):
+        return "{}"
+
+
+class _BaseTool:
+    pass
+
+
+_crewai = types.ModuleType("crewai")
+_crewai.crew = types.ModuleType("crewai.crew")
+_crewai.tools = types.ModuleType("crewai.tools")
+_crewai.Agent = type("Agent", (_CrewObject,), {})
+_crewai.Task = type("Task", (_CrewObject,), {})
+_crewai.Crew = _crewai.crew.Crew = _Crew
+_crewai.tools.BaseTool = _BaseTool
+sys.modules.update({"crewai": _crewai, "crewai.crew": _crewai.crew,
+                    "crewai.tools": _crewai.tools})
+
+import pytest  # noqa: E402
+import pytest_asyncio  # noqa: E402
+from httpx import AsyncClient, ASGITransport  # noqa: E402
+from app.main import app  # noqa: E402
+from app.tools import clear_caches  # noqa: E402
+from boto3.dynamodb.types import TypeSerializer  # noqa: E402
+import io  # noqa: E402
+import json  # noqa: E402
+
+# Canned Titan response, encoded once; each call gets a fresh stream
+_CANNED_EMBED = json.dumps({"embedding": [0.1, 0.2, 0.3]}).encode("utf-8")
+
+
+# ----------------------------
+# Async client: requests run on the test's own event loop
+# ----------------------------
+@pytest_asyncio.fixture
+async def aclient():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+        yield c
+
+
+# ----------------------------
+# Reset module-level RAG caches between tests
+# ----------------------------
+@pytest.fixture(autouse=True)
+def reset_rag_caches():
+    clear_caches()
+    CrossEncoderStub.reset_mock()
+    yield
 
 
 # ----------------------------
 # Bedrock mock (for embeddings + chat-like outputs)
+# Built once per session; each test gets it reset to the canned response
 # ----------------------------
+@pytest.fixture(scope="session")
+def _bedrock():
+    return MagicMock()
+
+
 @pytest.fixture
-def mock_bedrock():
-    bedrock = MagicMock()
+def mock_bedrock(_bedrock):
     # For RAGTool: embedding response
-    bedrock.invoke_model.return_value = {
-        "body": io.BytesIO(json.dumps({
-            "embedding": [0.1, 0.2, 0.3]
-        }).encode("utf-8"))
-    }
-    return bedrock
+    _bedrock.invoke_model.side_effect = lambda *a, **k: {
+        "body": io.BytesIO(_CANNED_EMBED)}
+    yield _bedrock
+    _bedrock.reset_mock(return_value=True, side_effect=True)
 
 
 # ----------------------------
 # OpenSearch mock (for RAGTool search)
 # ----------------------------
+@pytest.fixture(scope="session")
+def _opensearch():
+    return MagicMock()
+
+
 @pytest.fixture
-def mock_opensearch():
-    opensearch = MagicMock()
-    opensearch.search.return_value = {
+def mock_opensearch(_opensearch):
+    _opensearch.search.return_value = {
         "hits": {
             "hits": [
                 {"_source": {"content": "runbook-db-timeout"}},
@@ -45,41 +124,61 @@ def mock_opensearch():
             ]
         }
     }
-    return opensearch
+    yield _opensearch
+    _opensearch.reset_mock(return_value=True, side_effect=True)
+
 
 # ----------------------------
-# CrossEncoder mock (for reranking in RAGTool)
+# CrossEncoder mock (the instance the stub hands to RAGTool)
 # ----------------------------
 
 
 @pytest.fixture
 def mock_cross_encoder():
-    mock = MagicMock()
-    mock.predict = MagicMock(return_value=[0.9, 0.1])
-    return mock
+    return CrossEncoderStub.return_value
 
 # ----------------------------
-# DynamoDB mock (Moto)
+# DynamoDB mock: dict-backed stand-in for the audit Table resource
 # ----------------------------
+_serializer = TypeSerializer()
+
+
+class FakeTable:
+    """Covers the Table calls the app makes, keyed like IncidentAudit."""
+
+    def __init__(self):
+        self.items = {}
+
+    @staticmethod
+    def _key(item):
+        return item["incident_id"], item["timestamp"]
+
+    def put_item(self, Item, **kwargs):
+        # Serialize like the real Table so floats and other bad types fail
+        _serializer.serialize(Item)
+        self.items[self._key(Item)] = Item
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(self._key(Key))
+        return {"Item": item} if item is not None else {}
+
+    def delete_item(self, Key, **kwargs):
+        self.items.pop(self._key(Key), None)
+        return {}
+
+    def scan(self, **kwargs):
+        items = list(self.items.values())
+        return {"Items": items, "Count": len(items)}
+
+    @contextmanager
+    def batch_writer(self, **kwargs):
+        yield self
 
 
 @pytest.fixture
 def mock_dynamodb():
-    with mock_aws():
-        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
-        table = dynamodb.create_table(
-            TableName="IncidentAudit",
-            KeySchema=[
-                {"AttributeName": "incident_id", "KeyType": "HASH"},
-                {"AttributeName": "timestamp", "KeyType": "RANGE"},
-            ],
-            AttributeDefinitions=[
-                {"AttributeName": "incident_id", "AttributeType": "S"},
-                {"AttributeName": "timestamp", "AttributeType": "S"},
-            ],
-            BillingMode="PAY_PER_REQUEST",
-        )
-        yield table
+    yield FakeTable()
 
 
 # ----------------------------
@@ -87,8 +186,65 @@ def mock_dynamodb():
 # ----------------------------
 @pytest.fixture
 def mock_ssm():
-    with mock_aws():
-        ssm = boto3.client("ssm", region_name="us-east-1")
-        ssm.send_command = MagicMock()
-        ssm.send_command.return_value = {"Command": {"CommandId": "cmd-123"}}
-        yield ssm
+    ssm = MagicMock()
+    ssm.send_command.return_value = {"Command": {"CommandId": "cmd-123"}}
+    yield ssm
+
+
+# ----------------------------
+# App AWS clients: every test gets the mocks from the app._aws getters
+# ----------------------------
+@pytest.fixture(autouse=True)
+def _aws(monkeypatch, mock_bedrock, mock_ssm):
+    monkeypatch.setattr("app._aws.get_bedrock", lambda: mock_bedrock)
+    monkeypatch.setattr("app._aws.get_ssm", lambda: mock_ssm)
+
+
+# ----------------------------
+# Fully wired app: AWS clients, OpenSearch, audit table and Crew patched once
+# ----------------------------
+@pytest.fixture
+def wired(monkeypatch, mock_bedrock, mock_opensearch, mock_cross_encoder, mock_dynamodb, mock_ssm):
+    with ExitStack() as es:
+        es.enter_context(patch("app.tools.OpenSearch", return_value=mock_opensearch))
+        es.enter_context(patch("app.main.get_audit_table", return_value=mock_dynamodb))
+        yield SimpleNamespace(
+            bedrock=mock_bedrock,
+            opensearch=mock_opensearch,
+            table=mock_dynamodb,
+            set_crew=lambda out: monkeypatch.setattr(
+                _Crew, "kickoff", lambda self, inputs=None: out),
+        )
+
+
+# ----------------------------
+# Crew stages stubbed per role: run_agent answers from a role -> output map
+# (an output may be a callable taking the stage inputs) and records every
+# call; audit writes go to mock_dynamodb
+# ----------------------------
+class AgentStub:
+    def __init__(self, table):
+        self.table = table
+        self.outputs = {}
+        self.default = "{}"
+        self.calls = []
+
+    def __call__(self, agent, make_task, inputs):
+        self.calls.append((agent.role, inputs))
+        out = self.outputs.get(agent.role, self.default)
+        return out(inputs) if callable(out) else out
+
+    @property
+    def roles(self):
+        return [role for role, _ in self.calls]
+
+    def inputs(self, role):
+        return [inputs for r, inputs in self.calls if r == role]
+
+
+@pytest.fixture
+def agents(mock_dynamodb):
+    stub = AgentStub(mock_dynamodb)
+    with patch("app.main.run_agent", side_effect=stub), \
+            patch("app.main.get_audit_table", return_value=mock_dynamodb):
+        yield stub
@@ -0,0 +1,62 @@
+import pytest
+from unittest.mock import patch, call
+from app import index_runbooks
+from app.index_runbooks import generate_actions, index_all_runbooks
+
+
+@pytest.fixture
+def runbook_files(tmp_path):
+    files = []
+    for name in ("db.json", "net.json"):
+        path = tmp_path / name
+        path.write_text('{"id": "%s", "issue": "x", "resolution_steps": ["a", "b"]}' % name[:-5])
+        files.append(str(path))
+    bad = tmp_path / "bad.json"
+    bad.write_text("{not json")
+    files.append(str(bad))
+    return files
+
+
+def test_generate_actions_skips_bad_file(runbook_files, mock_bedrock, capsys):
+    actions = list(generate_actions(runbook_files))
+
+    # Embeddings come from the mocked app._aws.get_bedrock client
+    assert mock_bedrock.invoke_model.call_count == 2
+    assert sorted(a["_id"] for a in actions) == ["db", "net"]
+    assert actions[0]["_source"]["vector_field"] == [0.1, 0.2, 0.3]
+    assert actions[0]["_source"]["resolution_steps"] == "a\nb"
+    assert f"Failed to index {runbook_files[2]}" in capsys.readouterr().out
+
+
+@pytest.fixture
+def ingest():
+    with patch("app.index_runbooks.create_index_if_missing"), \
+            patch("app.index_runbooks.generate_actions", return_value=iter([])), \
+            patch("app.index_runbooks.set_refresh_interval") as refresh, \
+            patch("app.index_runbooks.helpers") as helpers, \
+            patch("app.index_runbooks.glob.glob", return_value=["a.json", "b.json"]):
+        yield refresh, helpers
+
+
+def test_refresh_interval_restored_when_bulk_fails(ingest):
+    refresh, helpers = ingest
+    helpers.bulk.side_effect = RuntimeError("cluster unavailable")
+
+    with pytest.raises(RuntimeError):
+        index_all_runbooks()
+
+    assert refresh.call_args_list == [call("-1"), call("1s")]
+
+
+@pytest.mark.parametrize("min_docs,parallel", [(2, True), (3, False)],
+                         ids=["at-threshold", "below-threshold"])
+def test_parallel_bulk_from_threshold(min_docs, parallel, ingest, monkeypatch):
+    _, helpers = ingest
+    monkeypatch.setattr(index_runbooks, "PARALLEL_BULK_MIN_DOCS", min_docs)
+    helpers.parallel_bulk.return_value = iter([(True, {}), (True, {})])
+    helpers.bulk.return_value = (2, [])
+
+    index_all_runbooks()
+
+    assert helpers.parallel_bulk.called is parallel
+    assert helpers.bulk.called is not parallel
@@ -1,15 +1,39 @@
 import pytest
+from unittest.mock import patch, MagicMock
+from app.main import handler, _parse_possible_json, resolve_alert, Alert
+from app.main import exponential_backoff_retry, TokenBucket, app, check_aws_credentials_once
+from app.main import get_audit_table
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import EndpointConnectionError
 from fastapi.testclient import TestClient
-from unittest.mock import patch
-from app.main import app
-import uuid
+from litellm.exceptions import RateLimitError
+import asyncio
+import time
+from decimal import Decimal
 import json
+import orjson
 
-client = TestClient(app)
+# Opaque id: get_audit_table is mocked, so nothing looks it up
+INCIDENT_ID = "00000000-0000-0000-0000-000000000001"
+
+# Request body shared by the process_alert tests, encoded once
+ALERT_BODY = orjson.dumps({"description": "DB timeout", "severity": "high"})
+JSON_HEADERS = {"content-type": "application/json"}
+
+# Mock Crew output: low confidence, executor skipped
+LOW_CONF_OUT = orjson.dumps({
+    "issue": "Database timeout",
+    "root_cause": "High load",
+    "impact": "API delays",
+    "resolution": "Scale RDS",
+    "confidence": 0.7,
+    "executed": False,
+    "details": "Skipped execution, awaiting approval"
+}).decode()
 
 
 # @pytest.mark.asyncio
-# async def test_process_alert_success(mock_bedrock, mock_opensearch, mock_cross_encoder, mock_dynamodb, mock_ssm):
+# async def test_process_alert_success(mock_bedrock, mock_opensearch, mock_dynamodb, mock_ssm, aclient):
 #     # Mock Crew output: high confidence, executor executed
 #     mock_crew_output = json.dumps({
 #         "issue": "Database timeout",
@@ -21,14 +45,11 @@ client = TestClient(app)
 #         "details": "SSM command executed"
 #     })
 
-#     with patch("app.tools.boto3.client", side_effect=[mock_bedrock, mock_ssm]), \
-#             patch("app.main.boto3.client", side_effect=[mock_bedrock]), \
-#             patch("app.tools.OpenSearch", return_value=mock_opensearch), \
-#             patch("sentence_transformers.CrossEncoder", return_value=mock_cross_encoder), \
+#     with patch("app.tools.OpenSearch", return_value=mock_opensearch), \
 #             patch("app.main.get_audit_table", return_value=mock_dynamodb), \
 #             patch("crewai.crew.Crew.kickoff", return_value=mock_crew_output):
 
-#         response = client.post("/process_alert", json={
+#         response = await aclient.post("/process_alert", json={
 #             "description": "DB timeout",
 #             "severity": "high",
 #             "metrics": {"cpu": 90}
@@ -46,98 +67,275 @@ client = TestClient(app)
 #         assert "executed" in resolution
 
 
+@pytest.mark.slow
 @pytest.mark.asyncio
-async def test_process_alert_low_confidence(mock_bedrock, mock_opensearch, mock_cross_encoder, mock_dynamodb, mock_ssm):
-    # Mock Crew output: low confidence, executor skipped
-    mock_crew_output = json.dumps({
-        "issue": "Database timeout",
-        "root_cause": "High load",
-        "impact": "API delays",
-        "resolution": "Scale RDS",
-        "confidence": 0.7,
-        "executed": False,
-        "details": "Skipped execution, awaiting approval"
-    })
-
-    with patch("app.tools.boto3.client", side_effect=[mock_bedrock, mock_ssm]), \
-            patch("app.main.boto3.client", side_effect=[mock_bedrock]), \
-            patch("app.tools.OpenSearch", return_value=mock_opensearch), \
-            patch("sentence_transformers.CrossEncoder", return_value=mock_cross_encoder), \
-            patch("app.main.get_audit_table", return_value=mock_dynamodb), \
-            patch("crewai.crew.Crew.kickoff", return_value=mock_crew_output):
-
-        response = client.post("/process_alert", json={
-            "description": "DB timeout",
-            "severity": "high"
-        })
-
-        assert response.status_code == 200
-        data = response.json()
-        assert data["status"] == "pending_human"
-
-        resolution = data["resolution"]
-        assert "confidence" in resolution
-        assert float(resolution["confidence"]) < 0.8
-        assert "executed" in resolution
-        assert resolution["executed"] is False
+async def test_process_alert_low_confidence(wired, aclient):
+    wired.set_crew(LOW_CONF_OUT)
+
+    response = await aclient.post("/process_alert", content=ALERT_BODY, headers=JSON_HEADERS)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "pending_human"
 
+    resolution = data["resolution"]
+    assert "confidence" in resolution
+    assert float(resolution["confidence"]) < 0.8
+    assert "executed" in resolution
+    assert resolution["executed"] is False
 
+
+@pytest.mark.slow
 @pytest.mark.asyncio
-async def test_process_alert_empty_runbooks(mock_bedrock, mock_opensearch, mock_dynamodb, mock_ssm):
+async def test_process_alert_empty_runbooks(wired, aclient):
     # OpenSearch returns no hits
-    mock_opensearch.search.return_value = {"hits": {"hits": []}}
-    mock_crew_output = "{}"
+    wired.opensearch.search.return_value = {"hits": {"hits": []}}
+
+    response = await aclient.post("/process_alert", content=ALERT_BODY, headers=JSON_HEADERS)
 
-    with patch("app.tools.boto3.client", side_effect=[mock_bedrock, mock_ssm]), \
-            patch("app.main.boto3.client", side_effect=[mock_bedrock]), \
-            patch("app.tools.OpenSearch", return_value=mock_opensearch), \
-            patch("app.main.get_audit_table", return_value=mock_dynamodb), \
-            patch("crewai.crew.Crew.kickoff", return_value=mock_crew_output):
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "pending_human"
+    assert "confidence" in data["resolution"]
+    assert "executed" in data["resolution"]
 
-        response = client.post("/process_alert", json={
-            "description": "DB timeout",
-            "severity": "high"
-        })
 
-        assert response.status_code == 200
-        data = response.json()
-        assert data["status"] == "pending_human"
-        assert "confidence" in data["resolution"]
-        assert "executed" in data["resolution"]
+@pytest.mark.asyncio
+async def test_process_alert_stages(agents, aclient):
+    agents.outputs = {
+        "Incident Classifier": "database",
+        "Runbook Selector": "runbook-db-timeout",
+        "Resolution Generator": json.dumps({"issue": "Database timeout", "confidence": 0.9}),
+        "Fix Executor": json.dumps({"executed": True, "command_id": "cmd-123"}),
+    }
+
+    response = await aclient.post("/process_alert", content=ALERT_BODY, headers=JSON_HEADERS)
+
+    assert response.status_code == 200
+    assert response.json()["resolution"]["issue"] == "Database timeout"
+    [analyzer_inputs] = agents.inputs("Resolution Generator")
+    assert analyzer_inputs["incident_type"] == "database"
+    assert analyzer_inputs["runbooks"] == "runbook-db-timeout"
+    assert agents.inputs("Fix Executor") == [{"analysis": agents.outputs["Resolution Generator"]}]
 
 
 @pytest.mark.asyncio
-async def test_approve_endpoint_accept(mock_dynamodb):
-    with patch("app.main.get_audit_table", return_value=mock_dynamodb):
-        incident_id = str(uuid.uuid4())
-        response = client.post(
-            f"/approve/{incident_id}",
-            json={"approved": True, "tweaks": {"resolution": "Scale RDS"}}
-        )
-        assert response.status_code == 200
-        assert response.json()["status"] == "approved"
+@pytest.mark.parametrize("confidence", [0.8, float("nan"), "nan"],
+                         ids=["threshold", "nan-literal", "nan-string"])
+async def test_process_alert_low_confidence_skips_executor(confidence, agents, aclient):
+    agents.outputs["Resolution Generator"] = json.dumps(
+        {"issue": "Database timeout", "confidence": confidence})
+
+    response = await aclient.post("/process_alert", content=ALERT_BODY, headers=JSON_HEADERS)
+
+    assert "Fix Executor" not in agents.roles
+    assert response.json()["status"] == "pending_human"
+    resolution = response.json()["resolution"]
+    assert resolution["executed"] is False
+    assert resolution["note"] == "Skipped due to low confidence"
 
 
 @pytest.mark.asyncio
-async def test_approve_endpoint_reject(mock_dynamodb):
-    with patch("app.main.get_audit_table", return_value=mock_dynamodb):
-        incident_id = str(uuid.uuid4())
-        response = client.post(
-            f"/approve/{incident_id}",
-            json={"approved": False}
-        )
-        assert response.status_code == 400
-        assert "Approval rejected" in response.json()["detail"]
+@pytest.mark.parametrize("number", ["0.12345678901234567890123456789012345678901", "1e400",
+                                    "1234567890123456789012345678901234567890123"],
+                         ids=["over-long", "overflow", "over-long-int"])
+async def test_resolve_alert_audits_unstorable_numbers(number, agents):
+    agents.outputs = {
+        "Resolution Generator": '{"issue": "Database timeout", "confidence": 0.9, "load": %s}' % number,
+        "Fix Executor": '{"executed": true, "command_id": "cmd-123"}',
+    }
+
+    result = await resolve_alert(Alert(description="DB timeout", severity="high"))
+
+    assert result["status"] == "resolved"
+    assert agents.table.scan()["Count"] == 1
 
 
 @pytest.mark.asyncio
-async def test_invalid_alert(mock_bedrock, mock_dynamodb, mock_ssm):
-    with patch("app.tools.boto3.client", side_effect=[mock_bedrock, mock_ssm]), \
-            patch("app.main.boto3.client", side_effect=[mock_bedrock]), \
-            patch("app.main.get_audit_table", return_value=mock_dynamodb), \
-            patch("crewai.crew.Crew.kickoff", return_value="{}"):
-
-        response = client.post(
-            "/process_alert", json={"description": "", "severity": "invalid"}
-        )
-        assert response.status_code == 422
+async def test_resolve_alert_does_not_block_event_loop(agents):
+    def slow_output(inputs):
+        time.sleep(0.2)
+        return "{}"
+
+    agents.default = slow_output
+
+    alert = Alert(description="DB timeout", severity="high")
+    start = time.perf_counter()
+    await asyncio.gather(resolve_alert(alert), resolve_alert(alert))
+
+    # Three 0.2s stages per alert; blocking the loop would serialize both alerts
+    assert time.perf_counter() - start < 1.2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body,expected_status,field,expected", [
+    ({"approved": True, "tweaks": {"resolution": "Scale RDS"}}, 200, "status", "approved"),
+    ({"approved": False}, 400, "detail", "Approval rejected"),
+], ids=["accept", "reject"])
+async def test_approve_endpoint(body, expected_status, field, expected, agents, aclient):
+    response = await aclient.post(f"/approve/{INCIDENT_ID}", json=body)
+    assert response.status_code == expected_status
+    assert expected in response.json()[field]
+
+
+def test_lifespan_checks_credentials_once_per_process():
+    check_aws_credentials_once.cache_clear()
+    sts = MagicMock()
+    sts.get_caller_identity.side_effect = EndpointConnectionError(endpoint_url="https://sts")
+    with patch("app.main.boto3.client", return_value=sts):
+        # Unreachable STS only logs; repeated lifespans (one per Mangum
+        # invocation) reuse the first result
+        for _ in range(3):
+            with TestClient(app):
+                pass
+        sts.get_caller_identity.assert_called_once()
+
+
+def test_audit_table_is_per_thread():
+    def tables():
+        return get_audit_table(), get_audit_table()
+
+    with patch("app._aws.new_dynamodb_resource", side_effect=lambda: MagicMock()):
+        with ThreadPoolExecutor(max_workers=1) as a, ThreadPoolExecutor(max_workers=1) as b:
+            (a1, a2), (b1, _) = a.submit(tables).result(), b.submit(tables).result()
+
+    assert a1 is a2
+    assert a1 is not b1
+
+
+def test_alert_model_normalizes_input():
+    alert = Alert(description="  DB timeout  ", severity="high", source="cloudwatch")
+    assert alert.description == "DB timeout"
+    assert alert.severity == "high" and type(alert.severity) is str
+
+    with pytest.raises(ValueError, match="Description must not be blank"):
+        Alert(description="   ", severity="high")
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_invalid_alert(wired, aclient):
+    response = await aclient.post(
+        "/process_alert", json={"description": "", "severity": "invalid"}
+    )
+    assert response.status_code == 422
+
+
+def test_sqs_batch_prefetches_runbooks(agents):
+    records = [
+        {"messageId": "m1", "eventSource": "aws:sqs",
+         "body": json.dumps({"description": "DB timeout", "severity": "high"})},
+        # What the AlertRule target actually delivers: the whole CloudWatch event
+        {"messageId": "m2", "eventSource": "aws:sqs", "body": json.dumps({
+            "version": "0", "id": "evt-1", "detail-type": "CloudWatch Alarm State Change",
+            "source": "aws.cloudwatch", "detail": {
+                "alarmName": "DiskFull",
+                "state": {"value": "ALARM", "reason": "Threshold Crossed: 1 datapoint [97.0]"},
+                "configuration": {"metrics": []}}})},
+        {"messageId": "m3", "eventSource": "aws:sqs", "body": "not json"},
+    ]
+
+    with patch("app.main.rag_tool.batch_run",
+               return_value=[["runbook-db-timeout", "runbook-other"], ["runbook-disk"]]) as run_batch:
+
+        response = handler({"Records": records}, None)
+
+        run_batch.assert_called_once_with(
+            ["DB timeout", "DiskFull: Threshold Crossed: 1 datapoint [97.0]"])
+        assert "Runbook Selector" not in agents.roles
+        alerts = [inputs["alert"] for inputs in agents.inputs("Incident Classifier")]
+        assert {a["incident_id"]: a["severity"] for a in alerts} == {None: "high", "evt-1": "high"}
+        # Alerts resolve concurrently, so analyzer calls may interleave
+        assert sorted(inputs["runbooks"] for inputs in agents.inputs("Resolution Generator")) == [
+            "runbook-db-timeout\n\nrunbook-other", "runbook-disk"]
+        assert response == {"batchItemFailures": [{"itemIdentifier": "m3"}]}
+        assert agents.table.scan()["Count"] == 2
+
+
+def test_sqs_batch_resolves_alerts_concurrently(agents):
+    records = [
+        {"messageId": f"m{i}", "eventSource": "aws:sqs",
+         "body": json.dumps({"description": f"alert {i}", "severity": "high"})}
+        for i in range(3)
+    ]
+
+    def slow_output(inputs):
+        time.sleep(0.2)
+        if inputs.get("alert", {}).get("description") == "alert 1":
+            raise RuntimeError("crew failed")
+        return "{}"
+
+    agents.default = slow_output
+
+    with patch("app.main.rag_tool.batch_run", return_value=[["runbook"]] * 3):
+
+        start = time.perf_counter()
+        response = handler({"Records": records}, None)
+
+        # Two 0.2s stages per alert; serial resolution would take 1.2s
+        assert time.perf_counter() - start < 1.0
+        assert response == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+        assert agents.table.scan()["Count"] == 2
+
+
+def test_sqs_batch_audit_flush_failure_does_not_retry_messages():
+    records = [
+        {"messageId": "m1", "eventSource": "aws:sqs",
+         "body": json.dumps({"description": "DB timeout", "severity": "high"})},
+    ]
+    table = MagicMock()
+    table.batch_writer.return_value.__enter__.return_value.put_item.side_effect = Exception(
+        "throttled")
+
+    with patch("app.main.rag_tool.batch_run", return_value=[["runbook-db-timeout"]]), \
+            patch("app.main.get_audit_table", return_value=table):
+
+        response = handler({"Records": records}, None)
+
+        # Falls back to per-item writes instead of re-driving executed alerts
+        table.put_item.assert_called_once()
+        assert response == {"batchItemFailures": []}
+
+
+@pytest.mark.parametrize("raw,expected", [
+    ('{"confidence": 0.9, "steps": [1, 2.5]}', {"confidence": Decimal("0.9"), "steps": [1, Decimal("2.5")]}),
+    ('Here is the result:\n{"issue": "a {b}", "nested": {"x": 1}} Hope it helps}', {
+     "issue": "a {b}", "nested": {"x": 1}}),
+    ('{"note": "quote \\" and } brace"}', {"note": 'quote " and } brace'}),
+    ('{"confidence": 0.12345678901234567890123456789012345678901}',
+     {"confidence": Decimal("0.12345678901234568")}),
+    ('{"confidence": 1e400, "load": NaN}', {"confidence": None, "load": None}),
+    ("no json here", {}),
+    ("{not valid}", {}),
+    ("", {}),
+])
+def test_parse_possible_json(raw, expected):
+    assert _parse_possible_json(raw) == expected
+
+
+def test_backoff_retry_full_jitter_on_rate_limit():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError("slow down", llm_provider="bedrock", model="claude")
+        return "ok"
+
+    limiter = MagicMock()
+    with patch("app.main.time.sleep") as sleep, \
+            patch("app.main.random.uniform", side_effect=lambda lo, hi: hi / 2) as uniform:
+        assert exponential_backoff_retry(flaky, limiter=limiter) == "ok"
+
+    assert [c.args for c in uniform.call_args_list] == [(0, 1.0), (0, 2.0)]
+    assert [c.args[0] for c in sleep.call_args_list] == [0.5, 1.0]
+    assert limiter.acquire.call_count == 3
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.perf_counter()
+    for _ in range(5):
+        bucket.acquire()
+    # First token is free, the next four are refilled at 20/s
+    assert time.perf_counter() - start >= 0.18
@@ -0,0 +1,37 @@
+import types
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import numpy as np
+from app.reranker import OnnxCrossEncoder
+
+
+def test_onnx_cross_encoder_predict():
+    session = MagicMock()
+    session.get_inputs.return_value = [SimpleNamespace(name="input_ids"),
+                                       SimpleNamespace(name="attention_mask")]
+    session.run.return_value = [np.array([[2.0], [-1.0], [0.0]], dtype=np.float32)]
+    tokenizer = MagicMock()
+    tokenizer.encode_batch.return_value = [
+        SimpleNamespace(ids=[101, i, 102], attention_mask=[1, 1, 1], type_ids=[0, 0, 1])
+        for i in range(3)
+    ]
+    ort = types.ModuleType("onnxruntime")
+    ort.InferenceSession = MagicMock(return_value=session)
+    tokenizers = types.ModuleType("tokenizers")
+    tokenizers.Tokenizer = MagicMock()
+    tokenizers.Tokenizer.from_file.return_value = tokenizer
+
+    with patch.dict("sys.modules", {"onnxruntime": ort, "tokenizers": tokenizers}):
+        encoder = OnnxCrossEncoder("/opt/models/reranker")
+
+    pairs = [("db timeout", "doc a"), ("db timeout", "doc b"), ("db timeout", "doc c")]
+    scores = encoder.predict(pairs)
+
+    tokenizer.encode_batch.assert_called_once_with(pairs)
+    inputs = session.run.call_args.args[1]
+    # The graph doesn't declare token_type_ids, so it isn't fed
+    assert set(inputs) == {"input_ids", "attention_mask"}
+    assert inputs["input_ids"].tolist() == [[101, 0, 102], [101, 1, 102], [101, 2, 102]]
+    np.testing.assert_allclose(scores, 1.0 / (1.0 + np.exp(-np.array([2.0, -1.0, 0.0]))),
+                               rtol=1e-6)
+    assert encoder.predict([]).size == 0